@@ -1,18 +1,37 @@
 import sys
 import re
 import os
+import json
+import shutil
+import tempfile
 import numpy as np
 import cv2
 import mss
-import pyautogui
 from PyQt5 import QtWidgets, QtCore, QtGui
 
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # optional: only used for the same-size fast path
+    HAVE_NUMBA = False
+
 # ---------------------
 # CONFIG
 # ---------------------
 TEMPLATES_DIR = "templates"  # folder with 6 alphabet images
+TEMPLATES_CACHE = "templates_cache"  # preprocessed templates as .npy, memory-mapped on later runs
 THRESHOLD = 0.75             # adjust after testing
 USE_EDGES = True             # use edge-based matching for robustness
+USE_CUDA = True              # match on the GPU when OpenCV is built with CUDA
+USE_OPENCL = True            # otherwise use OpenCV's T-API (UMat) on an OpenCL GPU
+EARLY_EXIT_SCORE = 0.9       # stop trying templates once one scores this high
+PREFILTER_SIZE = 32          # longest template side in the prefilter thumbnails
+PREFILTER_KEEP = 2           # templates that survive the prefilter to full matching
+PREFILTER_MIN_COVER = 0.75   # only prefilter when templates span this much of the ROI
+BINARY_MAX_WINDOWS = 100     # bit-packed matching only beats matchTemplate for this few windows
+COARSE_SIZE = 128            # longest ROI side for the coarse (downscaled) match
+COARSE_KEEP = 3              # templates the coarse rank passes on to the full-res match
+PREVIEW_EVERY = 3            # refresh the preview image every Nth tick
 
 # Mapping: symbol -> command
 COMMAND_MAP = {
@@ -34,18 +53,213 @@ KEY_SEND_MAP = {
     "BACK": "s"
 }
 
+# ---------------------
+# Key injection
+# ---------------------
+# pyautogui.press costs ~10 ms (screen-size queries, pauses); talk to the OS directly when we can
+WIN_VK_CODES = {"left": 0x25, "up": 0x26, "right": 0x27, "down": 0x28}
+X11_KEYSYMS = {"left": "Left", "right": "Right", "up": "Up", "down": "Down"}
+
+_key_sender = None
+
+def _sendinput_sender():
+    import ctypes
+    from ctypes import wintypes
+
+    class MOUSEINPUT(ctypes.Structure):
+        _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                    ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                    ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT)]
+
+    class INPUT(ctypes.Structure):
+        _fields_ = [("type", wintypes.DWORD), ("u", _INPUTUNION)]
+
+    INPUT_KEYBOARD, KEYEVENTF_KEYUP = 1, 0x0002
+    send_input = ctypes.windll.user32.SendInput
+
+    def send(name):
+        vk = WIN_VK_CODES.get(name) or ord(name.upper())
+        events = (INPUT * 2)()
+        for ev, flags in zip(events, (0, KEYEVENTF_KEYUP)):
+            ev.type = INPUT_KEYBOARD
+            ev.u.ki = KEYBDINPUT(vk, 0, flags, 0, 0)
+        send_input(2, events, ctypes.sizeof(INPUT))
+    return send
+
+def _pyautogui_press(name):
+    # imported on first use only: importing pyautogui needs a display
+    import pyautogui
+    pyautogui.press(name)
+
+def _xtest_sender():
+    from Xlib import X, XK, display
+    from Xlib.ext import xtest
+
+    disp = display.Display()
+    keycodes = {}
+
+    def send(name):
+        if name not in keycodes:
+            keycodes[name] = disp.keysym_to_keycode(XK.string_to_keysym(X11_KEYSYMS.get(name, name)))
+        code = keycodes[name]
+        if not code:
+            _pyautogui_press(name)
+            return
+        xtest.fake_input(disp, X.KeyPress, code)
+        xtest.fake_input(disp, X.KeyRelease, code)
+        disp.sync()
+    return send
+
+def _make_key_sender():
+    if sys.platform == "win32":
+        return _sendinput_sender()
+    if sys.platform.startswith("linux") and os.environ.get("DISPLAY"):
+        try:
+            return _xtest_sender()
+        except Exception as e:  # no python-xlib / XTEST extension
+            print("XTest unavailable, falling back to pyautogui:", e)
+    return _pyautogui_press
+
+def _send_key(name):
+    """Press and release key name (pyautogui key names)"""
+    global _key_sender
+    if _key_sender is None:
+        _key_sender = _make_key_sender()
+    _key_sender(name)
+
 # ---------------------
 # Template Matching Utils
 # ---------------------
-def preprocess(img):
-    """Convert to grayscale and optionally edges"""
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
-    gray = cv2.equalizeHist(gray)  # normalize contrast
+def to_gray(img):
+    if img.ndim == 3 and img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+def build_contrast_lut(gray):
+    """Histogram-equalization LUT computed from one calibration frame.
+
+    Same mapping equalizeHist would produce for that frame, but later frames
+    only pay for a cv2.LUT gather instead of a histogram + CDF pass each.
+    """
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    cdf = hist.cumsum()
+    cdf_min = cdf[hist > 0][0]
+    if cdf[-1] == cdf_min:  # flat frame, nothing to stretch
+        return np.arange(256, dtype=np.uint8)
+    lut = (cdf - cdf_min) * 255.0 / (cdf[-1] - cdf_min)
+    return np.clip(np.round(lut), 0, 255).astype(np.uint8)
+
+def preprocess(img, use_umat=False, lut=None):
+    """Convert (BGRA, BGR or gray) to grayscale, stretch contrast with lut, optionally edges.
+
+    With use_umat the LUT/Canny stages run on a cv2.UMat, letting OpenCV
+    dispatch them to OpenCL; the result is then a UMat as well.
+    """
+    gray = to_gray(img)
+    if use_umat:
+        gray = cv2.UMat(gray)
+    if lut is not None:
+        gray = cv2.LUT(gray, lut)  # normalize contrast
     if USE_EDGES:
         gray = cv2.Canny(gray, 50, 150)
     return gray
 
-def load_templates(folder):
+def preprocess_gpu(gpu_bgra, canny, stream, lut=None, bufs=None):
+    """preprocess() for a BGRA frame already on the GPU; the result stays on the device.
+
+    lut is a cv2.cuda LookUpTable built from build_contrast_lut(). bufs is an
+    optional (gray, contrast, edges) triple of GpuMats reused as outputs; all
+    work is queued on stream, so nothing waits until the caller syncs.
+    """
+    gray_buf, contrast_buf, edges_buf = bufs or (None, None, None)
+    gray = cv2.cuda.cvtColor(gpu_bgra, cv2.COLOR_BGRA2GRAY, dst=gray_buf, stream=stream)
+    if lut is not None:
+        gray = lut.transform(gray, dst=contrast_buf, stream=stream)
+    if USE_EDGES:
+        gray = canny.detect(gray, edges=edges_buf, stream=stream)
+    return gray
+
+def downscale(img, shape, dst=None, stream=None):
+    """INTER_AREA resize of a preprocessed frame to shape (h, w), on whichever device it lives"""
+    h, w = shape
+    if isinstance(img, (np.ndarray, cv2.UMat)):
+        return cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+    return cv2.cuda.resize(img, (w, h), dst=dst, interpolation=cv2.INTER_AREA, stream=stream)
+
+def to_host(img):
+    """numpy version of a preprocessed frame (ndarray, UMat or GpuMat)"""
+    if isinstance(img, np.ndarray):
+        return img
+    if isinstance(img, cv2.UMat):
+        return img.get()
+    return img.download()
+
+def template_cache_key(folder):
+    """What a template cache must have been built from: folder, mode and every source file's mtime/size"""
+    sources = []
+    for fname in sorted(os.listdir(folder)):
+        st = os.stat(os.path.join(folder, fname))
+        sources.append([fname, st.st_mtime_ns, st.st_size])
+    return {"folder": os.path.abspath(folder), "edges": USE_EDGES, "sources": sources}
+
+def read_template_cache(cache, key):
+    """Memory-mapped templates from cache if its manifest matches key, else None"""
+    try:
+        with open(os.path.join(cache, "manifest.json")) as f:
+            manifest = json.load(f)
+        if any(manifest.get(k) != v for k, v in key.items()):
+            return None
+        return {name: np.load(os.path.join(cache, name + ".npy"), mmap_mode="r")
+                for name in manifest["templates"]}
+    except (OSError, ValueError, KeyError):
+        return None
+
+def write_template_cache(cache, key, templates):
+    """Build the cache in a temp dir next to it, then swap it into place.
+
+    Readers see either the old complete cache, no cache (and rebuild), or the
+    new complete one: the manifest is written last and the directory is only
+    renamed in once everything is on disk.
+    """
+    parent = os.path.dirname(os.path.abspath(cache))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    try:
+        for name, img in templates.items():
+            np.save(os.path.join(tmp, name + ".npy"), img)
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump(dict(key, templates=list(templates)), f)
+        if os.path.isdir(cache):
+            # a directory can't be replaced while non-empty: move the stale one aside first
+            stale = tempfile.mkdtemp(prefix=".stale-", dir=parent)
+            os.replace(cache, os.path.join(stale, "old"))
+            shutil.rmtree(stale, ignore_errors=True)
+        os.replace(tmp, cache)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)  # only left over if something failed
+
+def load_templates(folder, cache_dir=TEMPLATES_CACHE):
+    """Load (and Canny) the template images, going through a .npy cache.
+
+    The cache is used only if its manifest matches folder, the edge mode and
+    the name/mtime/size of every source file; its arrays are opened with
+    mmap_mode="r" so concurrent runs share them via the page cache. Anything
+    missing or mismatched means a rebuild.
+    """
+    cache = os.path.join(cache_dir, "edges" if USE_EDGES else "gray")
+    key = template_cache_key(folder)
+    templates = read_template_cache(cache, key)
+    if templates is not None:
+        return templates
+
     templates = {}
     for fname in sorted(os.listdir(folder)):
         name, ext = os.path.splitext(fname)
@@ -56,31 +270,408 @@ def load_templates(folder):
         if USE_EDGES:
             img = cv2.Canny(img, 50, 150)
         templates[name] = img
+
+    try:
+        write_template_cache(cache, key, templates)
+    except OSError as e:  # read-only checkout, or another run swapped its cache in first
+        print("could not write template cache:", e)
     return templates
 
-def match_symbol(frame_gray, templates):
-    best_name = None
-    best_score = -1.0
+def opencl_available():
+    """True if USE_OPENCL is set and OpenCV's default OpenCL device is a GPU.
+
+    CPU-only OpenCL runtimes (pocl, Intel's CPU runtime) also report
+    haveOpenCL(), but running on them through UMat is slower than the numpy
+    CPU path and skips its fast paths (ncc_stack, bit-packed, prefilter).
+    """
+    if not (USE_OPENCL and cv2.ocl.haveOpenCL()):
+        return False
+    return bool(cv2.ocl.Device.getDefault().type() & cv2.ocl.Device_TYPE_GPU)
+
+def cuda_available():
+    """True if USE_CUDA is set and this OpenCV build can see a CUDA device"""
+    if not USE_CUDA or not hasattr(cv2, "cuda"):
+        return False
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except cv2.error:
+        return False
 
+def fit_template(tmpl, frame_shape):
+    """Shrink template (keeping aspect) so it fits inside the ROI"""
+    if tmpl.shape[0] > frame_shape[0] or tmpl.shape[1] > frame_shape[1]:
+        scale = min(frame_shape[0]/tmpl.shape[0], frame_shape[1]/tmpl.shape[1])
+        new_w, new_h = int(tmpl.shape[1]*scale), int(tmpl.shape[0]*scale)
+        return cv2.resize(tmpl, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return tmpl
+
+def rescale_templates(templates, frame_shape):
+    """Fit every template to an ROI of frame_shape (h, w) once, instead of per tick"""
+    return {name: fit_template(tmpl, frame_shape) for name, tmpl in templates.items()}
+
+def coarse_shape(frame_shape):
+    """ROI shape with the longest side at COARSE_SIZE, or None if already that small"""
+    h, w = frame_shape
+    scale = COARSE_SIZE / max(h, w)
+    if scale >= 1:
+        return None
+    return max(1, round(h * scale)), max(1, round(w * scale))
+
+def scale_templates(templates, frame_shape, small_shape):
+    """Shrink ROI-fitted templates by the same factor as frame_shape -> small_shape"""
+    sy, sx = small_shape[0] / frame_shape[0], small_shape[1] / frame_shape[1]
+    scaled = {}
     for name, tmpl in templates.items():
-        # resize template if needed to fit ROI
-        if tmpl.shape[0] > frame_gray.shape[0] or tmpl.shape[1] > frame_gray.shape[1]:
-            scale = min(frame_gray.shape[0]/tmpl.shape[0], frame_gray.shape[1]/tmpl.shape[1])
-            new_w, new_h = int(tmpl.shape[1]*scale), int(tmpl.shape[0]*scale)
-            tmpl_resized = cv2.resize(tmpl, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        new_h = min(small_shape[0], max(1, round(tmpl.shape[0] * sy)))
+        new_w = min(small_shape[1], max(1, round(tmpl.shape[1] * sx)))
+        scaled[name] = cv2.resize(tmpl, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return scaled
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def ncc_stack(frame, stack, tmpl_means, tmpl_norms):
+        """NCC of frame against each same-size template in stack (n, h, w)"""
+        h, w = frame.shape
+        f_mean = 0.0
+        for y in range(h):
+            for x in range(w):
+                f_mean += frame[y, x]
+        f_mean /= h * w
+        f_sq = 0.0
+        for y in range(h):
+            for x in range(w):
+                d = frame[y, x] - f_mean
+                f_sq += d * d
+        f_norm = np.sqrt(f_sq)
+
+        n = stack.shape[0]
+        scores = np.zeros(n, dtype=np.float32)
+        for k in prange(n):
+            t_mean = tmpl_means[k]
+            acc = 0.0
+            for y in range(h):
+                for x in range(w):
+                    acc += (frame[y, x] - f_mean) * (stack[k, y, x] - t_mean)
+            denom = f_norm * tmpl_norms[k]
+            scores[k] = acc / denom if denom > 0 else 0.0
+        return scores
+
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def binary_ncc_max(frame_phases, tmpl_bits, tmpl_count, tmpl_w, window_counts):
+        """Peak NCC of a packed binary template over packed binary frame rows.
+
+        frame_phases[p] holds the frame's bit rows starting at column p, packed
+        8 pixels per byte, so the window at column x is byte-aligned in phase
+        x & 7. The overlap count comes from AND + popcount; with the window's
+        and template's set-pixel counts that gives exact NCC for 0/1 images.
+        """
+        th, tw_bytes = tmpl_bits.shape
+        out_h, out_w = window_counts.shape
+        n = th * tmpl_w
+        b = tmpl_count
+        row_best = np.full(out_h, -1.0)
+        for y in prange(out_h):
+            best = -1.0
+            for x in range(out_w):
+                phase = x & 7
+                xb = x >> 3
+                c = 0
+                for r in range(th):
+                    for k in range(tw_bytes):
+                        c += POPCOUNT8[frame_phases[phase, y + r, xb + k] & tmpl_bits[r, k]]
+                a = window_counts[y, x]
+                # float: the int64 product overflows past ~110k template pixels
+                denom = float(a) * (n - a) * float(b) * (n - b)
+                score = (n * c - a * b) / np.sqrt(denom) if denom > 0 else 0.0
+                if score > best:
+                    best = score
+            row_best[y] = best
+        return row_best.max()
+
+def pack_template_bits(tmpl):
+    """(packed rows, set-pixel count, width) of a thresholded edge template"""
+    bits = (tmpl >= 128).astype(np.uint8)
+    return np.packbits(bits, axis=1), int(bits.sum()), bits.shape[1]
+
+def pack_frame_bits(frame):
+    """All 8 bit-phase packings of a binary frame plus its integral image (for window counts)"""
+    bits = (frame >= 128).astype(np.uint8)
+    h, w = bits.shape
+    phases = np.zeros((8, h, (w + 7) // 8), dtype=np.uint8)
+    for p in range(min(8, w)):
+        packed = np.packbits(bits[:, p:], axis=1)
+        phases[p, :, :packed.shape[1]] = packed
+    return phases, cv2.integral(bits, sdepth=cv2.CV_32S)
+
+def score_template_binary(frame_phases, frame_integral, tmpl_packed):
+    """score_template for binary edge maps, via the bit-packed numba kernel"""
+    tmpl_bits, count, tw = tmpl_packed
+    window_counts = window_sums(frame_integral, tmpl_bits.shape[0], tw).astype(np.int64)
+    return float(binary_ncc_max(frame_phases, tmpl_bits, count, tw, window_counts))
+
+def build_ncc_bank(templates, frame_shape):
+    """Stack templates that are exactly ROI-sized for ncc_stack.
+
+    When template and ROI have the same size matchTemplate only has a single
+    window to score, so one numba sweep over all of them is much cheaper.
+    Returns (names, stack, means, norms) or None.
+    """
+    if not HAVE_NUMBA:
+        return None
+    names = [name for name, tmpl in templates.items() if tmpl.shape == tuple(frame_shape)]
+    if not names:
+        return None
+    stack = np.stack([templates[name] for name in names])
+    centered = stack.astype(np.float64) - stack.mean(axis=(1, 2), keepdims=True)
+    means = stack.mean(axis=(1, 2))
+    norms = np.sqrt((centered * centered).sum(axis=(1, 2)))
+    return names, stack, means, norms
+
+def alloc_result_buffers(templates, frame_shape):
+    """One float32 matchTemplate result buffer per template, reused every tick"""
+    h, w = frame_shape
+    return {name: np.empty((h - tmpl.shape[0] + 1, w - tmpl.shape[1] + 1), dtype=np.float32)
+            for name, tmpl in templates.items()}
+
+def upload_gpu(img):
+    gm = cv2.cuda_GpuMat()
+    gm.upload(img)
+    return gm
+
+def score_template(frame_gray, tmpl):
+    """Peak TM_CCOEFF_NORMED score of tmpl anywhere in frame_gray (ndarray or UMat)"""
+    res = cv2.matchTemplate(frame_gray, tmpl, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, _ = cv2.minMaxLoc(res)
+    return max_val
+
+def normalize_template(tmpl):
+    """Contiguous float32 copy of tmpl with zero mean and unit L2 norm"""
+    t = np.ascontiguousarray(tmpl, dtype=np.float32)
+    t = t - t.mean()
+    norm = np.sqrt((t * t).sum())
+    return t / norm if norm > 0 else t
+
+def window_sums(integral, th, tw, out=None):
+    """Sum over every th x tw window, from an integral image"""
+    if out is None:
+        return integral[th:, tw:] - integral[:-th, tw:] - integral[th:, :-tw] + integral[:-th, :-tw]
+    np.subtract(integral[th:, tw:], integral[:-th, tw:], out=out)
+    out -= integral[th:, :-tw]
+    out += integral[:-th, :-tw]
+    return out
+
+def alloc_norm_buffers(templates, frame_shape):
+    """Scratch + output buffers for inverse_window_norms, one set per distinct template shape"""
+    h, w = frame_shape
+    bufs = {}
+    for tmpl in templates.values():
+        if tmpl.shape not in bufs:
+            out_shape = (h - tmpl.shape[0] + 1, w - tmpl.shape[1] + 1)
+            bufs[tmpl.shape] = (np.empty(out_shape, dtype=np.float64), np.empty(out_shape, dtype=np.float64),
+                                np.empty(out_shape, dtype=np.float32), np.empty(out_shape, dtype=bool))
+    return bufs
+
+def inverse_window_norms(frame_sum, frame_sqsum, th, tw, bufs):
+    """1 / ||window - window mean|| for every th x tw window (0 for flat windows), written into bufs"""
+    s, sq, inv, nonflat = bufs
+    window_sums(frame_sum, th, tw, out=s)
+    window_sums(frame_sqsum, th, tw, out=sq)
+    s *= s
+    s /= th * tw
+    sq -= s
+    # for integer pixels a non-flat window has sq >= (n-1)/n, so 0.25 only drops flat ones
+    np.greater_equal(sq, 0.25, out=nonflat)
+    np.maximum(sq, 0.25, out=sq)
+    np.sqrt(sq, out=sq)
+    inv.fill(0)
+    np.divide(1.0, sq, out=inv, where=nonflat)
+    return inv
+
+def score_template_normed(frame_f, tmpl_n, inv_norms, result=None):
+    """score_template for a normalize_template()d template, without per-call template stats.
+
+    With a zero-mean, unit-norm template plain TM_CCORR already subtracts the
+    window mean; scaling by each window's inverse norm (inverse_window_norms,
+    shared by every template of that shape) gives exactly TM_CCOEFF_NORMED.
+    """
+    res = cv2.matchTemplate(frame_f, tmpl_n, cv2.TM_CCORR, result=result)
+    np.multiply(res, inv_norms, out=res)
+    return float(res.max())
+
+def score_template_gpu(gpu_frame, gpu_tmpl, matcher, gpu_result, stream=None):
+    """Same as score_template, but the frame and template live on the GPU"""
+    if stream is None:
+        res = matcher.match(gpu_frame, gpu_tmpl, gpu_result)
+    else:
+        # queued behind the preprocessing on the same stream; minMaxLoc needs it finished
+        res = matcher.match(gpu_frame, gpu_tmpl, gpu_result, stream)
+        stream.waitForCompletion()
+    _, max_val, _, _ = cv2.cuda.minMaxLoc(res)
+    return max_val
+
+def smooth_thumb(thumb):
+    """Blur a prefilter thumbnail so sub-pixel offsets of sparse edges barely change it"""
+    return cv2.GaussianBlur(thumb, (5, 5), 1.0)
+
+class TemplateBank:
+    """Templates prepared for one ROI size, in whatever form the backend needs.
+
+    backend is "cuda", "ocl" or "cpu"; match() takes the preprocessed frame as
+    a numpy array (cpu), a UMat (ocl) or a GpuMat / numpy array (cuda); stream
+    is the cv2.cuda.Stream the frame was produced on. binary marks CPU frames
+    as 0/255 edge maps; they are matched bit-packed when every template is
+    strictly 0/255 too (INTER_AREA resizing greys edges, and the packed NCC
+    would then differ from CCOEFF_NORMED) and has at most BINARY_MAX_WINDOWS
+    positions (ROI about template size), since the kernel scores each window
+    directly while matchTemplate does not.
+    A thumbnail prefilter keeps only the PREFILTER_KEEP closest templates;
+    those are tried most-recent-winner first, stopping early once one scores
+    EARLY_EXIT_SCORE.
+    """
+
+    def __init__(self, templates, frame_shape, backend, stream=None, binary=False):
+        self.frame_shape = tuple(frame_shape)
+        self.backend = backend
+        h, w = self.frame_shape
+        self.binary = (binary and backend == "cpu" and HAVE_NUMBA and bool(templates) and
+                       all((h - t.shape[0] + 1) * (w - t.shape[1] + 1) <= BINARY_MAX_WINDOWS
+                           and np.isin(t, (0, 255)).all()
+                           for t in templates.values()))
+        self.stream = stream
+        self.templates = templates
+        self.names = list(templates)
+        self.order = list(range(len(self.names)))  # indices into names, most recent winner first
+        self._scores = np.empty(len(self.names), dtype=np.float32)
+        self._fast_idx = []
+        self.ncc_bank = None
+        # Prefilter thumbnails: ROI and templates shrunk by one common factor, so the
+        # template thumbnails can still slide over the ROI thumbnail (offset tolerant).
+        # Only worth it when each template spans most of the ROI.
+        self._thumbs = None
+        if len(templates) > PREFILTER_KEEP and all(
+                t.shape[0] >= PREFILTER_MIN_COVER * h and t.shape[1] >= PREFILTER_MIN_COVER * w
+                for t in templates.values()):
+            scale = PREFILTER_SIZE / max(max(t.shape) for t in templates.values())
+            self._thumb_shape = (max(1, round(h * scale)), max(1, round(w * scale)))
+            self._thumbs = [smooth_thumb(t) for t in
+                            scale_templates(templates, self.frame_shape, self._thumb_shape).values()]
+        if backend == "cuda":
+            self.gpu_templates = {name: upload_gpu(tmpl) for name, tmpl in templates.items()}
+            self.gpu_matchers = {name: cv2.cuda.createTemplateMatching(cv2.CV_8UC1, cv2.TM_CCOEFF_NORMED)
+                                 for name in templates}
+            self.gpu_results = {name: cv2.cuda_GpuMat() for name in templates}
+            self.gpu_frame = cv2.cuda_GpuMat()
+        elif backend == "ocl":
+            self.ocl_templates = {name: cv2.UMat(tmpl) for name, tmpl in templates.items()}
         else:
-            tmpl_resized = tmpl
+            self.ncc_bank = build_ncc_bank(templates, frame_shape)
+            if self.ncc_bank is not None:
+                self._fast_idx = [self.names.index(name) for name in self.ncc_bank[0]]
+            self.res_bufs = alloc_result_buffers(templates, frame_shape)
+            self.norm_templates = {name: normalize_template(tmpl) for name, tmpl in templates.items()}
+            self._frame_f = np.empty((h, w), dtype=np.float32)
+            self._frame_sum = np.empty((h + 1, w + 1), dtype=np.float64)
+            self._frame_sqsum = np.empty((h + 1, w + 1), dtype=np.float64)
+            self._norm_bufs = alloc_norm_buffers(templates, frame_shape)
+            self._norms_ready = set()  # template shapes whose norms are current for this tick
+            if self.binary:
+                self.bit_templates = {name: pack_template_bits(tmpl) for name, tmpl in templates.items()}
+                self._frame_phases = self._frame_bit_integral = None
+
+    def score(self, name, frame):
+        if self.backend == "cuda":
+            return score_template_gpu(frame, self.gpu_templates[name], self.gpu_matchers[name],
+                                      self.gpu_results[name], self.stream)
+        if self.backend == "ocl":
+            return score_template(frame, self.ocl_templates[name])
+        if self.binary:
+            return score_template_binary(self._frame_phases, self._frame_bit_integral,
+                                         self.bit_templates[name])
+        tmpl_n = self.norm_templates[name]
+        bufs = self._norm_bufs[tmpl_n.shape]
+        if tmpl_n.shape not in self._norms_ready:
+            inverse_window_norms(self._frame_sum, self._frame_sqsum, *tmpl_n.shape, bufs)
+            self._norms_ready.add(tmpl_n.shape)
+        return score_template_normed(self._frame_f, tmpl_n, bufs[2], self.res_bufs[name])
+
+    def shortlist(self, frame):
+        """Indices of the PREFILTER_KEEP templates whose thumbnails best match the frame's"""
+        if self._thumbs is None:
+            return set(range(len(self.names)))
+        if self.stream is not None:
+            self.stream.waitForCompletion()
+        thumb = smooth_thumb(to_host(downscale(frame, self._thumb_shape)))
+        thumb_scores = np.array([cv2.matchTemplate(thumb, t, cv2.TM_CCOEFF_NORMED).max()
+                                 for t in self._thumbs])
+        return set(np.argpartition(-thumb_scores, PREFILTER_KEEP - 1)[:PREFILTER_KEEP].tolist())
+
+    def prepare(self, frame_gray):
+        """Per-tick frame setup shared by every template; returns the frame to score"""
+        frame = frame_gray
+        if self.backend == "cuda" and isinstance(frame_gray, np.ndarray):
+            self.gpu_frame.upload(frame_gray)
+            frame = self.gpu_frame
+        elif self.binary:
+            self._frame_phases, self._frame_bit_integral = pack_frame_bits(frame_gray)
+        elif self.backend == "cpu":
+            # float conversion and integral images once per tick, shared by all templates
+            np.copyto(self._frame_f, frame_gray)
+            cv2.integral2(frame_gray, self._frame_sum, self._frame_sqsum, cv2.CV_64F, cv2.CV_64F)
+            self._norms_ready.clear()
+        return frame
+
+    def score_fast(self, frame, scores):
+        """Score the ROI-sized templates in one ncc_stack sweep; returns their indices"""
+        if self.ncc_bank is not None and frame.shape == self.ncc_bank[1].shape[1:]:
+            _, stack, means, norms = self.ncc_bank
+            scores[self._fast_idx] = ncc_stack(frame, stack, means, norms)
+            return self._fast_idx
+        return ()
 
-        res = cv2.matchTemplate(frame_gray, tmpl_resized, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(res)
+    def rank(self, frame_gray, keep):
+        """Indices of the keep best-scoring templates; scores all of them, no early exit"""
+        frame = self.prepare(frame_gray)
+        scores = self._scores
+        fast_idx = self.score_fast(frame, scores)
+        for i, name in enumerate(self.names):
+            if i not in fast_idx:
+                scores[i] = self.score(name, frame)
+        return set(np.argsort(-scores)[:keep].tolist())
 
-        if max_val > best_score:
-            best_score = max_val
-            best_name = name
+    def match(self, frame_gray, candidates=None):
+        """(symbol or None, best score); candidates (template indices, e.g. from a
+        coarse rank) replaces the thumbnail shortlist"""
+        if not self.names:
+            return None, -1.0
+        frame = self.prepare(frame_gray)
 
-    if best_score >= THRESHOLD:
-        return best_name, best_score
-    return None, best_score
+        # per-template scores; templates skipped by the early exit stay at -1
+        scores = self._scores
+        scores.fill(-1.0)
+        fast_idx = self.score_fast(frame, scores)
+
+        if scores.max() < EARLY_EXIT_SCORE:
+            if candidates is None:
+                candidates = self.shortlist(frame)
+            for i in self.order:
+                if i in fast_idx or i not in candidates:
+                    continue
+                max_val = self.score(self.names[i], frame)
+                scores[i] = max_val
+                if max_val >= EARLY_EXIT_SCORE:
+                    break
+
+        best = int(scores.argmax())
+        best_score = float(scores[best])
+        if best_score >= THRESHOLD:
+            # most recent winner is tried first next tick
+            self.order.remove(best)
+            self.order.insert(0, best)
+            return self.names[best], best_score
+        return None, best_score
 
 # ---------------------
 # PyQt5 GUI
@@ -125,7 +716,191 @@ class SelectionOverlay(QtWidgets.QWidget):
         self.close()
 
 
+class MatchWorker(QtCore.QObject):
+    """Capture + match loop, living on its own QThread so matching never blocks the UI"""
+    # symbol ("" if no match), score, preview image (null on ticks without a preview refresh)
+    result = QtCore.pyqtSignal(str, float, QtGui.QImage)
+
+    def __init__(self, templates, backend, preview_size):
+        super().__init__()
+        self.templates = templates
+        self.backend = backend
+        self.preview_size = preview_size  # (w, h) of the preview label
+        self.region = None
+        self.sct = None
+        self.timer = None
+
+        # Template banks for the current ROI (full res + coarse), rebuilt by set_region
+        self._rescaled_shape = None
+        self._bank = None
+        self._coarse_bank = None
+
+        # Preview: two persistent buffers + QImages, alternated so the UI thread can still
+        # be drawing one while the next tick writes the other
+        self._preview_every = PREVIEW_EVERY
+        self._tick = 0
+        self._preview_bufs = []
+        self._qimgs = []
+        self._preview_idx = 0
+
+        # CUDA: page-locked staging buffer for the BGRA grab, uploaded asynchronously
+        self._pinned = None
+        self._gpu_bgra = None
+        self._stream = None
+        self._canny = None
+        self._gpu_bufs = None   # persistent (gray, contrast, edges) outputs
+        self._gpu_small = None  # coarse-level edges
+
+        # Contrast LUT, calibrated on the first frame after a region change
+        self._lut = None
+        self._gpu_lut = None
+
+        # Last frame's subsample digest and result, to skip unchanged frames
+        self._last_digest = None
+        self._last_result = (None, -1.0)
+
+    @QtCore.pyqtSlot()
+    def setup(self):
+        """Per-thread state: mss handles and OpenCV's OpenCL switch are thread-local"""
+        self.sct = mss.mss()
+        cv2.ocl.setUseOpenCL(self.backend == "ocl")
+        # paced loop: a single-shot timer re-armed after each tick for whatever is left of
+        # the interval, so long ticks don't queue up behind a fixed-rate timer
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.tick)
+        self._elapsed = QtCore.QElapsedTimer()
+        self._interval = 0
+        self._running = False
+        if self.backend == "cuda":
+            self._stream = cv2.cuda.Stream()
+            self._canny = cv2.cuda.createCannyEdgeDetector(50, 150)
+            self._gpu_bgra = cv2.cuda_GpuMat()
+            self._gpu_bufs = (cv2.cuda_GpuMat(), cv2.cuda_GpuMat(), cv2.cuda_GpuMat())
+            self._gpu_small = cv2.cuda_GpuMat()
+
+    @QtCore.pyqtSlot(tuple)
+    def set_region(self, region):
+        self.region = region
+        x, y, w, h = region
+        self.rescale_templates((h, w))
+
+    @QtCore.pyqtSlot(int)
+    def start(self, interval):
+        self._interval = interval
+        self._running = True
+        self.timer.start(0)
+
+    @QtCore.pyqtSlot()
+    def stop(self):
+        self._running = False
+        self.timer.stop()
+
+    @QtCore.pyqtSlot()
+    def tick(self):
+        self._elapsed.start()
+        try:
+            self.capture_and_match()
+        finally:
+            if self._running:
+                self.timer.start(max(0, self._interval - self._elapsed.elapsed()))
+
+    def rescale_templates(self, frame_shape):
+        self._rescaled_shape = frame_shape
+        self._lut = None
+        self._last_digest = None
+        fitted = rescale_templates(self.templates, frame_shape)
+        # Canny output is 0/255, so the full-res level may be matched bit-packed
+        # (see TemplateBank); the INTER_AREA-downscaled coarse level is not binary any more
+        self._bank = TemplateBank(fitted, frame_shape, self.backend, self._stream, binary=USE_EDGES)
+        small_shape = coarse_shape(frame_shape)
+        if small_shape is None:
+            self._coarse_bank = None
+        else:
+            small = scale_templates(fitted, frame_shape, small_shape)
+            self._coarse_bank = TemplateBank(small, small_shape, self.backend, self._stream)
+        self.alloc_preview(frame_shape)
+        if self.backend == "cuda":
+            self.alloc_pinned(frame_shape)
+
+    def alloc_pinned(self, frame_shape):
+        """Page-lock a persistent BGRA host buffer so uploads skip the pageable staging copy"""
+        if self._pinned is not None:
+            cv2.cuda.unregisterPageLocked(self._pinned)
+        h, w = frame_shape
+        self._pinned = np.empty((h, w, 4), dtype=np.uint8)
+        cv2.cuda.registerPageLocked(self._pinned)
+
+    def alloc_preview(self, frame_shape):
+        """Size the preview buffers to the ROI aspect, fitted into the preview label"""
+        h, w = frame_shape
+        label_w, label_h = self.preview_size
+        scale = min(label_w / w, label_h / h)
+        pw, ph = max(1, int(w * scale)), max(1, int(h * scale))
+        self._preview_bufs = [np.empty((ph, pw), dtype=np.uint8) for _ in range(2)]
+        self._qimgs = [QtGui.QImage(buf.data, pw, ph, buf.strides[0], QtGui.QImage.Format_Grayscale8)
+                       for buf in self._preview_bufs]
+
+    def capture_and_match(self):
+        x, y, w, h = self.region
+        bbox = {"left": x, "top": y, "width": w, "height": h}
+        s_img = self.sct.grab(bbox)
+        # view mss's raw BGRA buffer in place instead of copying it with np.array()
+        frame = np.frombuffer(s_img.raw, dtype=np.uint8).reshape(s_img.height, s_img.width, 4)
+
+        # mss may hand back a different size than requested (e.g. HiDPI scaling)
+        if frame.shape[:2] != self._rescaled_shape:
+            self.rescale_templates(frame.shape[:2])
+
+        # unchanged region (e.g. game paused): reuse last result, skip the whole pipeline
+        digest = hash(frame[::8, ::8].tobytes())
+        if digest == self._last_digest:
+            symbol, score = self._last_result
+            self.result.emit(symbol or "", float(score), QtGui.QImage())
+            return
+        self._last_digest = digest
+
+        if self._lut is None:
+            self._lut = build_contrast_lut(to_gray(frame))
+            if self.backend == "cuda":
+                self._gpu_lut = cv2.cuda.createLookUpTable(self._lut)
+
+        if self.backend == "cuda":
+            np.copyto(self._pinned, frame)
+            self._gpu_bgra.upload(self._pinned, self._stream)
+            edges = preprocess_gpu(self._gpu_bgra, self._canny, self._stream, self._gpu_lut, self._gpu_bufs)
+        else:
+            edges = preprocess(frame, use_umat=self.backend == "ocl", lut=self._lut)
+
+        # coarse-to-fine: rank all templates on a small copy, then confirm only the
+        # COARSE_KEEP best at full res (coarse scores alone pick wrong symbols)
+        candidates = None
+        if self._coarse_bank is not None:
+            edges_small = downscale(edges, self._coarse_bank.frame_shape, self._gpu_small, self._stream)
+            candidates = self._coarse_bank.rank(edges_small, COARSE_KEEP)
+        symbol, score = self._bank.match(edges, candidates)
+
+        self._last_result = (symbol, score)
+
+        # Preview image (throttled, drawn from the persistent buffers)
+        qimg = QtGui.QImage()
+        self._tick += 1
+        if self._tick % self._preview_every == 0:
+            gray = to_host(edges)
+            buf = self._preview_bufs[self._preview_idx]
+            ph, pw = buf.shape
+            cv2.resize(gray, (pw, ph), dst=buf, interpolation=cv2.INTER_AREA)
+            qimg = self._qimgs[self._preview_idx]
+            self._preview_idx ^= 1
+
+        self.result.emit(symbol or "", float(score), qimg)
+
+
 class MainWindow(QtWidgets.QWidget):
+    region_changed = QtCore.pyqtSignal(tuple)
+    start_requested = QtCore.pyqtSignal(int)
+    stop_requested = QtCore.pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Screen OCR → Commands (Template Matching)")
@@ -155,7 +930,7 @@ class MainWindow(QtWidgets.QWidget):
 
         # Checkboxes
         cb_layout = QtWidgets.QHBoxLayout()
-        self.send_keys_cb = QtWidgets.QCheckBox("Send keypress via pyautogui")
+        self.send_keys_cb = QtWidgets.QCheckBox("Send keypress")
         self.send_keys_cb.setChecked(False)
         cb_layout.addWidget(self.send_keys_cb)
         cb_layout.addStretch()
@@ -180,11 +955,29 @@ class MainWindow(QtWidgets.QWidget):
 
         # Vars
         self.region = None
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.capture_and_match)
-        self.sct = mss.mss()
         self.templates = load_templates(TEMPLATES_DIR)
 
+        # GPU matching keeps templates resident on the device, only the ROI is uploaded per tick.
+        # No CUDA: let the T-API push preprocessing and matching to OpenCL (iGPUs etc.)
+        if cuda_available():
+            backend = "cuda"
+        elif opencl_available():
+            backend = "ocl"
+        else:
+            backend = "cpu"
+
+        # Capture + matching run on a worker thread; results come back as signals
+        self.worker = MatchWorker(self.templates, backend,
+                                  (self.preview_label.width(), self.preview_label.height()))
+        self.worker_thread = QtCore.QThread(self)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.setup)
+        self.region_changed.connect(self.worker.set_region)
+        self.start_requested.connect(self.worker.start)
+        self.stop_requested.connect(self.worker.stop)
+        self.worker.result.connect(self.on_result)
+        self.worker_thread.start()
+
     def open_selector(self):
         self.overlay = SelectionOverlay()
         self.overlay.region_selected.connect(self.set_region)
@@ -193,6 +986,7 @@ class MainWindow(QtWidgets.QWidget):
     def set_region(self, region):
         self.region = region
         x, y, w, h = region
+        self.region_changed.emit(region)
         self.last_text_label.setText(f"Last detected symbol: (region set {x},{y} {w}x{h})")
 
     def start_capture(self):
@@ -200,28 +994,18 @@ class MainWindow(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "No region", "Please select a region first.")
             return
         interval = self.interval_spin.value()
-        self.timer.start(interval)
+        self.start_requested.emit(interval)
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         self.select_btn.setEnabled(False)
 
     def stop_capture(self):
-        self.timer.stop()
+        self.stop_requested.emit()
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.select_btn.setEnabled(True)
 
-    def capture_and_match(self):
-        x, y, w, h = self.region
-        bbox = {"left": x, "top": y, "width": w, "height": h}
-        s_img = self.sct.grab(bbox)
-        frame = np.array(s_img)
-        if frame.shape[2] == 4:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-
-        gray = preprocess(frame)
-        symbol, score = match_symbol(gray, self.templates)
-
+    def on_result(self, symbol, score, qimg):
         if symbol:
             self.last_text_label.setText(f"Last detected symbol: {symbol} (score={score:.2f})")
             cmd = COMMAND_MAP.get(symbol, "(none)")
@@ -229,19 +1013,21 @@ class MainWindow(QtWidgets.QWidget):
 
             if self.send_keys_cb.isChecked() and cmd in KEY_SEND_MAP:
                 try:
-                    pyautogui.press(KEY_SEND_MAP[cmd])
+                    _send_key(KEY_SEND_MAP[cmd])
                 except Exception as e:
-                    print("pyautogui error:", e)
+                    print("keypress error:", e)
         else:
             self.last_text_label.setText(f"Last detected symbol: (no match)")
             self.last_cmd_label.setText("Mapped command: (none)")
 
-        # Preview image
-        preview = cv2.resize(gray, (480, max(1, int(480 * gray.shape[0] / gray.shape[1]))))
-        qimg = QtGui.QImage(preview.data, preview.shape[1], preview.shape[0], preview.strides[0],
-                            QtGui.QImage.Format_Grayscale8)
-        pix = QtGui.QPixmap.fromImage(qimg)
-        self.preview_label.setPixmap(pix.scaled(self.preview_label.size(), QtCore.Qt.KeepAspectRatio))
+        if not qimg.isNull():
+            self.preview_label.setPixmap(QtGui.QPixmap.fromImage(qimg))
+
+    def closeEvent(self, event):
+        self.stop_requested.emit()
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        super().closeEvent(event)
 
 
 # ---------------------
@@ -0,0 +1,125 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project"))
+try:
+    import Project
+except Exception as e:  # needs PyQt5 and mss
+    pytest.skip(f"Project.py not importable: {e}", allow_module_level=True)
+
+
+def reference_score(frame, tmpl):
+    res = cv2.matchTemplate(frame, tmpl, cv2.TM_CCOEFF_NORMED)
+    return float(res.max())
+
+
+def random_edges(rng, shape, density=0.1):
+    return np.where(rng.random(shape) < density, 255, 0).astype(np.uint8)
+
+
+@pytest.mark.skipif(not Project.HAVE_NUMBA, reason="numba not installed")
+@pytest.mark.parametrize("shape", [(164, 186), (37, 53)])
+def test_ncc_stack_matches_opencv(shape):
+    rng = np.random.default_rng(2)
+    templates = {f"t{i}": rng.integers(0, 256, shape, dtype=np.uint8) for i in range(4)}
+    templates["edges"] = random_edges(rng, shape)
+    names, stack, means, norms = Project.build_ncc_bank(templates, shape)
+
+    for frame in (rng.integers(0, 256, shape, dtype=np.uint8),
+                  np.clip(templates["t1"] + rng.normal(0, 40, shape), 0, 255).astype(np.uint8)):
+        scores = Project.ncc_stack(frame, stack, means, norms)
+        expected = [reference_score(frame, templates[name]) for name in names]
+        np.testing.assert_allclose(scores, expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("roi", [(164, 186), (170, 190), (220, 300)])
+def test_score_template_normed_matches_opencv(roi):
+    rng = np.random.default_rng(3)
+    # two templates share a shape (and so their inverse window norms)
+    templates = {"a": rng.integers(0, 256, (120, 140), dtype=np.uint8),
+                 "b": random_edges(rng, (120, 140)),
+                 "c": rng.integers(0, 256, (164, 186), dtype=np.uint8)}
+    bufs = Project.alloc_norm_buffers(templates, roi)
+    frame_sum = np.empty((roi[0] + 1, roi[1] + 1), dtype=np.float64)
+    frame_sqsum = np.empty_like(frame_sum)
+
+    for frame in (rng.integers(0, 256, roi, dtype=np.uint8), random_edges(rng, roi)):
+        frame[:120, -140:] = templates["a"]
+        frame_f = frame.astype(np.float32)
+        cv2.integral2(frame, frame_sum, frame_sqsum, cv2.CV_64F, cv2.CV_64F)
+        for name, tmpl in templates.items():
+            inv = Project.inverse_window_norms(frame_sum, frame_sqsum, *tmpl.shape, bufs[tmpl.shape])
+            score = Project.score_template_normed(frame_f, Project.normalize_template(tmpl), inv)
+            assert score == pytest.approx(reference_score(frame, tmpl), abs=1e-4), name
+
+
+@pytest.mark.skipif(not Project.HAVE_NUMBA, reason="numba not installed")
+@pytest.mark.parametrize("roi, tmpl_shape, density", [
+    ((164, 186), (164, 186), 0.1),
+    ((170, 190), (164, 186), 0.1),
+    ((180, 200), (164, 186), 0.1),
+    ((40, 50), (23, 31), 0.1),
+    ((400, 404), (400, 400), 0.3),   # past the old int64 overflow in the denominator
+    ((600, 602), (600, 600), 0.1),
+])
+def test_score_template_binary_matches_opencv(roi, tmpl_shape, density):
+    rng = np.random.default_rng(0)
+    th, tw = tmpl_shape
+    tmpl = random_edges(rng, tmpl_shape, density)
+    frame = random_edges(rng, roi, density)
+    x = (roi[1] - tw) // 2
+    frame[roi[0] - th:, x:x + tw] = np.where(rng.random(tmpl_shape) < 0.05, 255 - tmpl, tmpl)
+
+    phases, integral = Project.pack_frame_bits(frame)
+    score = Project.score_template_binary(phases, integral, Project.pack_template_bits(tmpl))
+    assert score == pytest.approx(reference_score(frame, tmpl), abs=1e-4)
+
+
+def test_binary_path_needs_strictly_binary_templates():
+    if not Project.HAVE_NUMBA:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(1)
+    tmpl = random_edges(rng, (164, 186))
+    assert Project.TemplateBank({"t": tmpl}, (164, 186), "cpu", binary=True).binary
+
+    shrunk = Project.fit_template(tmpl, (150, 160))
+    bank = Project.TemplateBank({"t": shrunk}, (150, 160), "cpu", binary=True)
+    assert not bank.binary, "INTER_AREA shrunk templates are greyscale"
+
+
+@pytest.fixture(scope="module")
+def templates(tmp_path_factory):
+    cache = tmp_path_factory.mktemp("cache")
+    return Project.load_templates(os.path.join(ROOT, "templates"), str(cache))
+
+
+@pytest.mark.parametrize("roi", [(200, 230), (300, 400), (500, 700), (700, 500)])
+def test_coarse_to_fine_agrees_with_full_res(templates, roi):
+    # same banks MatchWorker.rescale_templates builds
+    fitted = Project.rescale_templates(templates, roi)
+    bank = Project.TemplateBank(fitted, roi, "cpu", binary=True)
+    small_shape = Project.coarse_shape(roi)
+    coarse = Project.TemplateBank(Project.scale_templates(fitted, roi, small_shape), small_shape, "cpu")
+
+    rng = np.random.default_rng(sum(roi))
+    names = list(fitted)
+    for name, tmpl in fitted.items():
+        th, tw = tmpl.shape
+        for noise in (0.0, 0.02, 0.05):
+            for _ in range(4):
+                y, x = rng.integers(0, roi[0] - th + 1), rng.integers(0, roi[1] - tw + 1)
+                frame = np.where(rng.random(roi) < noise, 255, 0).astype(np.uint8)
+                frame[y:y + th, x:x + tw] |= tmpl
+
+                scores = [reference_score(frame, fitted[n]) for n in names]
+                best = int(np.argmax(scores))
+                expected = names[best] if scores[best] >= Project.THRESHOLD else None
+
+                candidates = coarse.rank(Project.downscale(frame, small_shape), Project.COARSE_KEEP)
+                symbol, _ = bank.match(frame, candidates)
+                assert symbol == expected, f"{name} at ({y}, {x}), noise {noise}, in {roi}"
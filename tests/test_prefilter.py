@@ -0,0 +1,34 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project"))
+try:
+    import Project
+except Exception as e:  # needs PyQt5 and mss
+    pytest.skip(f"Project.py not importable: {e}", allow_module_level=True)
+
+
+@pytest.fixture(scope="module")
+def templates(tmp_path_factory):
+    cache = tmp_path_factory.mktemp("cache")
+    return Project.load_templates(os.path.join(ROOT, "templates"), str(cache))
+
+
+@pytest.mark.parametrize("roi", [(170, 190), (180, 210), (200, 230), (218, 248)])
+def test_shortlist_keeps_true_template(templates, roi):
+    h, w = roi
+    fitted = Project.rescale_templates(templates, roi)
+    bank = Project.TemplateBank(fitted, roi, "cpu")
+    assert bank._thumbs is not None, "ROI should pass the PREFILTER_MIN_COVER gate"
+
+    for i, (name, tmpl) in enumerate(fitted.items()):
+        th, tw = tmpl.shape
+        for y in (0, (h - th) // 2, h - th):
+            for x in (0, (w - tw) // 3, w - tw):
+                frame = np.zeros(roi, dtype=np.uint8)
+                frame[y:y + th, x:x + tw] = tmpl
+                assert i in bank.shortlist(frame), f"{name} dropped at offset ({y}, {x}) in {roi}"
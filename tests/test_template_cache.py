@@ -0,0 +1,75 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project"))
+try:
+    import Project
+except Exception as e:  # needs PyQt5 and mss
+    pytest.skip(f"Project.py not importable: {e}", allow_module_level=True)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    src = tmp_path / "templates"
+    shutil.copytree(os.path.join(ROOT, "templates"), src)
+    return str(src)
+
+
+def cached(templates):
+    """True if load_templates served these from the cache (memory-mapped) rather than rebuilding"""
+    return all(isinstance(t, np.memmap) for t in templates.values())
+
+
+def assert_same(a, b):
+    assert list(a) == list(b)
+    for name in a:
+        np.testing.assert_array_equal(a[name], b[name])
+
+
+def test_cache_round_trips_as_memmap(folder, tmp_path):
+    fresh = Project.load_templates(folder, str(tmp_path / "cache"))
+    assert not cached(fresh)
+    again = Project.load_templates(folder, str(tmp_path / "cache"))
+    assert cached(again)
+    assert_same(fresh, again)
+
+
+def test_cache_rebuilds_after_touching_a_source(folder, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = Project.load_templates(folder, cache_dir)
+    path = os.path.join(folder, sorted(os.listdir(folder))[0])
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    rebuilt = Project.load_templates(folder, cache_dir)
+    assert not cached(rebuilt)
+    assert_same(first, rebuilt)
+    assert cached(Project.load_templates(folder, cache_dir))
+
+
+def test_cache_rebuilds_after_deleting_an_npy(folder, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = Project.load_templates(folder, cache_dir)
+    cache = os.path.join(cache_dir, "edges" if Project.USE_EDGES else "gray")
+    os.remove(os.path.join(cache, next(iter(first)) + ".npy"))
+
+    rebuilt = Project.load_templates(folder, cache_dir)
+    assert not cached(rebuilt)
+    assert_same(first, rebuilt)
+    assert cached(Project.load_templates(folder, cache_dir))
+
+
+def test_cache_rebuilds_after_editing_a_source(folder, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    Project.load_templates(folder, cache_dir)
+    a, b = sorted(os.listdir(folder))[:2]
+    shutil.copyfile(os.path.join(folder, b), os.path.join(folder, a))
+
+    rebuilt = Project.load_templates(folder, cache_dir)
+    assert not cached(rebuilt)
+    np.testing.assert_array_equal(rebuilt[os.path.splitext(a)[0]], rebuilt[os.path.splitext(b)[0]])